@@ -1,24 +1,37 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 import struct
 import sys
+import os
+import mmap
 import getopt
-from collections import OrderedDict
+import multiprocessing
+from array import array
+from itertools import chain, islice
 
 
 # flags
 LIR = 0
 HIR = 1
 
+# slot heading the S and Q lists
+SENTINEL = 0
+
 # constants
 MIN_STACK_FACTOR       = 1.0
 MIN_CACHE_SIZE         = 200
 DEFAULT_STACK_FACTOR   = 2
 MIN_HIR_PCT            = 1
 DEFAULT_HIR_PCT        = 1
-MAX_HIR_PCT            = 100
+MAX_HIR_PCT            = 99  # leaves at least 2 LIR blocks of a MIN_CACHE_SIZE cache
 MIN_HIR_RESIDENT       = 2
+DEFAULT_WORKERS        = 1
+DEFAULT_WARMUP         = 0
+RECORD_FORMAT          = '<Q'  # parda traces are packed little-endian 64-bit block numbers
+RECORD_SIZE            = struct.calcsize(RECORD_FORMAT)
+ASCII_CHUNK_SIZE       = 1 << 20
+INVARIANT_CHECK_INTERVAL = 10000  # minimum references between checkInvariants() calls
 
 # program usage string
 usageString = """usage: %s [options]
@@ -27,18 +40,22 @@ usageString = """usage: %s [options]
   -f <sizeLimitFactor>   size limit factor on S list
   -r <hirPercent>        HIR resident percentage of cache size
   -a                     read trace in ascii mode (default is parda)
-  -h print this message (help)"""
-
-class Entry:
-    def __init__(self, key):
-        self.key = key
-        self.flag = HIR
-        self.resident = True
-
-    def __repr__(self):
-        return "key=%s, flag=%s, resident=%s" % (self.key, self.flag, self.resident)
+  -p <workers>           replay a parda trace in parallel chunks (approximate)
+  -w <warmupRefs>        the first warmupRefs references only warm up the cache and
+                         are not measured (parallel chunks also warm up on the
+                         warmupRefs references before them)
+  -h print this message (help)
+run with python -O to skip the internal consistency checks"""
 
 class LIRS:
+    # no per-instance __dict__, the hot path reads and writes these on every reference
+    __slots__ = ('c', 'lirs', 'hirs', 'maxhirs', 'maxlirs',
+                 'slots', 'keys', 'flag', 'resident', 'inS', 'freeSlots',
+                 'sPrev', 'sNext', 'sLength', 'hPrev', 'hNext', 'qPrev', 'qNext',
+                 'refs', 'misses', 'lastKey', 'recordLirs', 'repeatedReference',
+                 'pruneCount', 'sizeLimitFactor', 'hirPercent', 'maxSlength',
+                 'processReference')
+
     def __repr__(self):
         return "LIRS"
 
@@ -48,8 +65,36 @@ class LIRS:
         self.hirs = 0
         self.maxhirs = max(MIN_HIR_RESIDENT, (hirPercent*0.01)*cacheSize)
         self.maxlirs = cacheSize - self.maxhirs
-        self.S = OrderedDict()  # Big LRU queue (LIR blocks, non-resident HIR blocks and some resident HIR blocks)
-        self.Q = OrderedDict()  # Small LRU queue (only resident HIR blocks)
+        # Every block in S or Q owns a slot in the single slots map, its metadata is
+        # kept in parallel arrays indexed by slot. Between references a block is in
+        # one of four states:
+        #   LIR               flag LIR, resident,     in S
+        #   HIR in S and Q    flag HIR, resident,     in S
+        #   HIR in Q only     flag HIR, resident,     not in S
+        #   HIR non-resident  flag HIR, not resident, in S
+        # so Q membership is implied by a resident HIR flag. Leaving S or Q only
+        # unlinks the slot, the block is dropped from slots and its slot recycled
+        # through freeSlots once it is in neither list.
+        # Slots are handed out on demand, a new one is appended to every array only
+        # when freeSlots is empty, so memory follows the blocks actually tracked.
+        self.slots = {}  # key -> slot
+        self.keys = [None]  # slot -> key
+        self.flag = bytearray(1)
+        self.resident = bytearray(1)
+        self.inS = bytearray(1)
+        self.freeSlots = []
+        # S and Q are circular doubly-linked lists threaded through the slots,
+        # slot SENTINEL heads both: next[SENTINEL] is the LRU, prev[SENTINEL] the MRU.
+        # S: Big LRU queue (LIR blocks, non-resident HIR blocks and some resident HIR blocks)
+        self.sPrev = array('i', [SENTINEL])
+        self.sNext = array('i', [SENTINEL])
+        self.sLength = 0
+        # the HIR blocks of S in the same LRU to MRU order, heads the search in shrink()
+        self.hPrev = array('i', [SENTINEL])
+        self.hNext = array('i', [SENTINEL])
+        # Q: Small LRU queue (only resident HIR blocks)
+        self.qPrev = array('i', [SENTINEL])
+        self.qNext = array('i', [SENTINEL])
         self.refs = 0
         self.misses = 0
         self.lastKey = None
@@ -57,187 +102,484 @@ class LIRS:
         self.repeatedReference = False
         self.pruneCount = 0
         self.sizeLimitFactor = sizeLimitFactor
+        self.hirPercent = hirPercent
         self.maxSlength = sizeLimitFactor * cacheSize
         self.lastKey = None
-
-    # processes rference through LIRS
-    # returns True on a hit and False on a miss
-    def processReference(self, key):
-        self.refs += 1
-        if key == self.lastKey:
-            return True
-        self.lastKey = key
-        entry = None
-        hit = False
-        if key in self.S:
-            entry = self.S[key]
-            # LIR block, HIR non-resident or HIR resident block
-            self.removeFromS(entry)
-            if entry.flag == HIR:
-                # A HIR block with lower reuse distance than the oldest LIR element,
-                # this block now becomes LIR.
-                if entry.resident:
-                    self.removeFromQ(entry)
-                    hit = True
-                else:
-                    # access to a non-resident HIR block is a miss
-                    hit = False
-
-                # Make space in Q for a migration
-                if self.hirs >= self.maxhirs:
-                    self.evictQentryLRU() # Make space for one HIR resident block in Q
-                entry.flag = LIR
-                entry.resident = True
-
-                assert self.hirs <= self.maxhirs
-                self.migrateLIRtoHIR()   # Change one LIR block to a HIR page
-                self.prune() # the migrated block might have been LIR in the LRU position of S
-            else:
-                hit = True
-                assert entry.flag == LIR and entry.resident
-                self.prune()  #  If this was a LIR element at the bottom
-        elif key in self.Q:
-            # hit in Q
-            hit = True
-            entry = self.Q[key]
-            assert key == entry.key
-            assert entry.resident and entry.flag == HIR
-            self.removeFromQ(entry)
-            # reuse distance is large so we don't make it a LIR page
-            # but promote to MRU in Q
-            self.addQentryMRU(key, entry)
+        # specialized for this configuration, see makeProcessReference
+        self.processReference = makeProcessReference(self)
+
+    # processes every reference of an iterable of blocks through LIRS.
+    # A reference to the same block as the previous one is a hit that changes
+    # nothing, so it is only counted here without calling processReference.
+    def processTrace(self, blocks):
+        process = self.processReference
+        lastKey = self.lastKey
+        repeats = 0
+        for key in blocks:
+            if key == lastKey:
+                repeats += 1
+                continue
+            lastKey = key
+            process(key)
+        self.refs += repeats
+
+    # returns a slot for a new block, initialized as a resident HIR block
+    # that is in neither S nor Q
+    def allocSlot(self, key):
+        if self.freeSlots:
+            slot = self.freeSlots.pop()
+            self.keys[slot] = key
+            self.flag[slot] = HIR
+            self.resident[slot] = True
         else:
-            # miss
-            hit = False
-            entry = Entry(key)
-            # When a miss occurs and a free block is needed for replacement,
-            # evict an HIR block that is resident in the cache
-
-            if self.lirs < self.maxlirs:
-                entry.flag = LIR   # Not using all the cache, make it a LIR page
-            else:
-                #remove the LRU from Q and insert this entry to the MRU position of Q
-                # NOTE: The number of LIR blocks doesn't change.
-                if self.hirs >= self.maxhirs:
-                    self.evictQentryLRU()
-                self.addQentryMRU(key, entry)
-                assert entry.flag == HIR and entry.resident == True
-        # always add the entry to the MRU of S
-        self.addSentryMRU(key, entry)
-
-        # sanity check
-        assert self.peekSentryLRU().flag == LIR
-
-        self.shrink()
-        self.recordLirs = max(self.recordLirs, len(self.S))
-
-        if not hit:
-            self.misses += 1
-        return hit
+            slot = len(self.keys)
+            self.keys.append(key)
+            self.flag.append(HIR)
+            self.resident.append(True)
+            self.inS.append(False)
+            self.sPrev.append(SENTINEL)
+            self.sNext.append(SENTINEL)
+            self.qPrev.append(SENTINEL)
+            self.qNext.append(SENTINEL)
+            self.hPrev.append(SENTINEL)
+            self.hNext.append(SENTINEL)
+        self.slots[key] = slot
+        return slot
+
+    # release the slot of a block that is in neither S nor Q
+    def freeSlot(self, slot):
+        del self.slots[self.keys[slot]]
+        self.keys[slot] = None
+        self.freeSlots.append(slot)
 
     # remove the LRU entry from S (should be LIR)
     # change it's flag to HIR and put it in the MRU position of Q
     def migrateLIRtoHIR(self):
-        key, entry = self.popSentryLRU()
-        #print "migrating %s from LIR to HIR" % key
-        assert key == entry.key
-        assert entry.flag == LIR and entry.resident
-        entry.flag = HIR
-        self.addQentryMRU(key, entry)
+        slot = self.popSentryLRU()
+        #print("migrating %s from LIR to HIR" % self.keys[slot])
+        assert self.flag[slot] == LIR and self.resident[slot]
+        self.flag[slot] = HIR
+        self.addQentryMRU(slot)
         # Switched this LIR block to HIR and put it to the MRU position of Q
         # Important! Don't put it back in S
 
     def prune(self):
         self.pruneCount += 1
-        while self.S:
-            entryLRU = self.peekSentryLRU()
-            if entryLRU.flag == LIR:
+        while self.sLength:
+            slotLRU = self.peekSentryLRU()
+            if self.flag[slotLRU] == LIR:
                 break
-            key, entry = self.popSentryLRU()
-            assert key == entry.key
-            assert key == entryLRU.key
-            assert entry.flag == HIR
-            if entry.resident:
-                assert key in self.Q
-            else:
-                assert key not in self.Q
+            slot = self.popSentryLRU()
+            if not self.resident[slot]:
+                # not in Q either
+                self.freeSlot(slot)
 
     # evict the LRU entry from Q and mark it non-resident
     def evictQentryLRU(self):
-        assert self.hirs >= self.maxhirs
-        key, entry = self.popQentryLRU()
-        assert entry.flag == HIR and entry.resident
-        entry.resident = False  # It is maybe in S
+        slot = self.popQentryLRU()
+        assert self.flag[slot] == HIR and self.resident[slot]
+        self.resident[slot] = False  # It is maybe in S
+        if not self.inS[slot]:
+            self.freeSlot(slot)
         assert self.hirs <= self.maxhirs
 
     # ensure that the size of S is at most self.maxSlength
     def shrink(self):
-        # TODO: Optimize this by caching the pointer.
-        if len(self.S) > self.maxSlength:
+        if self.sLength > self.maxSlength:
             # Remove oldest HIR block from S
-            # This iterates from LRU to MRU
-            for key, entry in self.S.iteritems():
-                if entry.flag == HIR:
-                    del self.S[key]
-                    break
-        assert len(self.S) <= self.maxSlength
-
-    # remove entry from S, regardless of location
-    def removeFromS(self, entry):
-        del self.S[entry.key]
-        if entry.flag == LIR and entry.resident:
+            slot = self.hNext[SENTINEL]
+            if slot != SENTINEL:
+                self.removeFromS(slot)
+                if not self.resident[slot]:
+                    self.freeSlot(slot)
+        assert self.sLength <= self.maxSlength
+
+    # remove slot from S, regardless of location
+    def removeFromS(self, slot):
+        prev = self.sPrev[slot]
+        next = self.sNext[slot]
+        self.sNext[prev] = next
+        self.sPrev[next] = prev
+        self.inS[slot] = False
+        self.sLength -= 1
+        if self.flag[slot] == HIR:
+            prev = self.hPrev[slot]
+            next = self.hNext[slot]
+            self.hNext[prev] = next
+            self.hPrev[next] = prev
+        elif self.resident[slot]:
             self.lirs -= 1
 
-    # remove entry from Q, regardless of location
-    def removeFromQ(self, entry):
-        del self.Q[entry.key]
+    # remove slot from Q, regardless of location
+    def removeFromQ(self, slot):
+        prev = self.qPrev[slot]
+        next = self.qNext[slot]
+        self.qNext[prev] = next
+        self.qPrev[next] = prev
         self.hirs -= 1
-        assert entry.resident
-
-    # insert key -> entry to the MRU position of S
-    def addSentryMRU(self, key, entry):
-        self.S[key] = entry
-        if entry.flag == LIR and entry.resident:
+        assert self.resident[slot]
+
+    # insert slot to the MRU position of S
+    def addSentryMRU(self, slot):
+        mru = self.sPrev[SENTINEL]
+        self.sNext[mru] = slot
+        self.sPrev[slot] = mru
+        self.sNext[slot] = SENTINEL
+        self.sPrev[SENTINEL] = slot
+        self.inS[slot] = True
+        self.sLength += 1
+        if self.flag[slot] == HIR:
+            mru = self.hPrev[SENTINEL]
+            self.hNext[mru] = slot
+            self.hPrev[slot] = mru
+            self.hNext[slot] = SENTINEL
+            self.hPrev[SENTINEL] = slot
+        elif self.resident[slot]:
             self.lirs += 1
 
-    # insert key -> entry to the MRU position of Q
-    def addQentryMRU(self, key, entry):
-        self.Q[key] = entry
+    # insert slot to the MRU position of Q
+    def addQentryMRU(self, slot):
+        mru = self.qPrev[SENTINEL]
+        self.qNext[mru] = slot
+        self.qPrev[slot] = mru
+        self.qNext[slot] = SENTINEL
+        self.qPrev[SENTINEL] = slot
         self.hirs += 1
 
     # pops the LRU entry from S
     def popSentryLRU(self):
-        key, entry = self.S.popitem(last=False)
-        if entry.flag == LIR and entry.resident:
-            self.lirs -= 1
-        return key, entry
+        slot = self.sNext[SENTINEL]
+        self.removeFromS(slot)
+        return slot
 
     # pops the LRU entry from Q
     def popQentryLRU(self):
-        key, entry = self.Q.popitem(last=False)
-        self.hirs -= 1
-        return key, entry
+        slot = self.qNext[SENTINEL]
+        self.removeFromQ(slot)
+        return slot
 
+    # returns the slot of the LRU entry in S
     def peekSentryLRU(self):
-        return self.S.itervalues().next()
+        return self.sNext[SENTINEL]
 
+    # returns the slot of the LRU entry in Q
     def peekQentryLRU(self):
-        return self.Q.itervalues().next()
+        return self.qNext[SENTINEL]
+
+    # walks S, its HIR list and Q and asserts the LIRS invariants,
+    # called every max(INVARIANT_CHECK_INTERVAL, maxSlength) references unless run
+    # with python -O, so its cost per reference stays constant
+    def checkInvariants(self):
+        flag = self.flag
+        resident = self.resident
+        # the bottom of S is always a LIR block
+        assert flag[self.sNext[SENTINEL]] == LIR
+        length = 0
+        lirs = 0
+        hirsInS = []
+        slot = self.sNext[SENTINEL]
+        while slot != SENTINEL:
+            assert self.inS[slot]
+            assert self.sPrev[self.sNext[slot]] == slot
+            length += 1
+            if flag[slot] == LIR:
+                assert resident[slot]
+                lirs += 1
+            else:
+                hirsInS.append(slot)
+            slot = self.sNext[slot]
+        assert length == self.sLength <= self.maxSlength
+        assert lirs == self.lirs
+        # the HIR list holds the HIR blocks of S in the same order
+        hirList = []
+        slot = self.hNext[SENTINEL]
+        while slot != SENTINEL:
+            hirList.append(slot)
+            slot = self.hNext[slot]
+        assert hirList == hirsInS
+        hirs = 0
+        slot = self.qNext[SENTINEL]
+        while slot != SENTINEL:
+            assert flag[slot] == HIR and resident[slot]
+            assert self.qPrev[self.qNext[slot]] == slot
+            hirs += 1
+            slot = self.qNext[slot]
+        assert hirs == self.hirs < self.maxhirs + 1  # Q fills up to ceil(maxhirs)
+        assert len(self.slots) == len(self.keys) - 1 - len(self.freeSlots)
+
+    # clears the counters, the cache state is kept. Llirs restarts from the
+    # current size of S so the peak reached during warmup is not reported.
+    def resetStatistics(self):
+        self.refs = 0
+        self.misses = 0
+        self.pruneCount = 0
+        self.recordLirs = self.sLength
 
     def print_statistics(self):
-        print "Memory size                        = %d" % self.c
-        print "Max S size                         = %d" % self.maxSlength
-        print "Llirs (max reached size of S)      = %d" % self.recordLirs
-        print "Lhirs (cache size for HIR blocks)  = %d" % self.hirs
-        print "Final blocks refs                  = %d" % self.refs
-        print "Final number of misses             = %d" % self.misses
-        print "Final hit rate                     = %2.5lf%%" % (100.0 * (1.0 - self.misses/float(self.refs)))
-        print "Prune count                        = %d" % self.pruneCount
+        hitRate = 100.0 * (1.0 - self.misses / self.refs) if self.refs else 0.0
+        print(f"Memory size                        = {self.c:d}\n"
+              f"Max S size                         = {int(self.maxSlength):d}\n"
+              f"Llirs (max reached size of S)      = {self.recordLirs:d}\n"
+              f"Lhirs (cache size for HIR blocks)  = {self.hirs:d}\n"
+              f"Final blocks refs                  = {self.refs:d}\n"
+              f"Final number of misses             = {self.misses:d}\n"
+              f"Final hit rate                     = {hitRate:2.5f}%\n"
+              f"Prune count                        = {self.pruneCount:d}")
+
+
+# builds the processReference function of alg. The configuration, the slot arrays
+# and the helper methods are bound once as closure variables, so a reference
+# does not look them up as attributes of alg.
+def makeProcessReference(alg):
+    maxlirs = alg.maxlirs
+    maxhirs = alg.maxhirs
+    maxSlength = alg.maxSlength
+    checkInterval = max(INVARIANT_CHECK_INTERVAL, int(maxSlength))
+    slots = alg.slots
+    flag = alg.flag
+    resident = alg.resident
+    inS = alg.inS
+    sPrev = alg.sPrev
+    sNext = alg.sNext
+    hPrev = alg.hPrev
+    hNext = alg.hNext
+    qPrev = alg.qPrev
+    qNext = alg.qNext
 
+    # processes rference through LIRS
+    # returns True on a hit and False on a miss
+    # The list helpers (removeFromS, addSentryMRU, removeFromQ, addQentryMRU,
+    # popSentryLRU) and the bodies of migrateLIRtoHIR and prune are inlined.
+    def processReference(key):
+        alg.refs += 1
+        if key == alg.lastKey:
+            return True
+        alg.lastKey = key
+        slot = slots.get(key)
+        hit = False
+        if slot is None:
+            # miss
+            hit = False
+            slot = alg.allocSlot(key)
+            # When a miss occurs and a free block is needed for replacement,
+            # evict an HIR block that is resident in the cache
+
+            if alg.lirs < maxlirs:
+                flag[slot] = LIR   # Not using all the cache, make it a LIR page
+            else:
+                #remove the LRU from Q and insert this entry to the MRU position of Q
+                # NOTE: The number of LIR blocks doesn't change.
+                if alg.hirs >= maxhirs:
+                    alg.evictQentryLRU()
+                mru = qPrev[SENTINEL]
+                qNext[mru] = slot
+                qPrev[slot] = mru
+                qNext[slot] = SENTINEL
+                qPrev[SENTINEL] = slot
+                alg.hirs += 1
+        elif inS[slot]:
+            # LIR block, HIR non-resident or HIR resident block
+            prev = sPrev[slot]
+            next = sNext[slot]
+            sNext[prev] = next
+            sPrev[next] = prev
+            inS[slot] = False
+            alg.sLength -= 1
+            if flag[slot] == HIR:
+                prev = hPrev[slot]
+                next = hNext[slot]
+                hNext[prev] = next
+                hPrev[next] = prev
+                # A HIR block with lower reuse distance than the oldest LIR element,
+                # this block now becomes LIR.
+                if resident[slot]:
+                    prev = qPrev[slot]
+                    next = qNext[slot]
+                    qNext[prev] = next
+                    qPrev[next] = prev
+                    alg.hirs -= 1
+                    hit = True
+                else:
+                    # access to a non-resident HIR block is a miss
+                    hit = False
+
+                # Make space in Q for a migration
+                if alg.hirs >= maxhirs:
+                    alg.evictQentryLRU() # Make space for one HIR resident block in Q
+                flag[slot] = LIR
+                resident[slot] = True
+
+                # Change the LIR block in the LRU position of S to a HIR page
+                # and put it to the MRU position of Q, but not back in S
+                lru = sNext[SENTINEL]
+                assert flag[lru] == LIR and resident[lru]
+                next = sNext[lru]
+                sNext[SENTINEL] = next
+                sPrev[next] = SENTINEL
+                inS[lru] = False
+                alg.sLength -= 1
+                alg.lirs -= 1
+                flag[lru] = HIR
+                mru = qPrev[SENTINEL]
+                qNext[mru] = lru
+                qPrev[lru] = mru
+                qNext[lru] = SENTINEL
+                qPrev[SENTINEL] = lru
+                alg.hirs += 1
+            else:
+                hit = True
+                assert resident[slot]
+                alg.lirs -= 1
+
+            # prune, the migrated block or this LIR block might have been in the
+            # LRU position of S. SENTINEL is flagged LIR and stops on an empty S.
+            alg.pruneCount += 1
+            lru = sNext[SENTINEL]
+            while flag[lru] == HIR:
+                next = sNext[lru]
+                sNext[SENTINEL] = next
+                sPrev[next] = SENTINEL
+                inS[lru] = False
+                alg.sLength -= 1
+                prev = hPrev[lru]
+                next = hNext[lru]
+                hNext[prev] = next
+                hPrev[next] = prev
+                if not resident[lru]:
+                    # not in Q either
+                    alg.freeSlot(lru)
+                lru = sNext[SENTINEL]
+        else:
+            # hit in Q
+            hit = True
+            assert resident[slot] and flag[slot] == HIR
+            # reuse distance is large so we don't make it a LIR page
+            # but promote to MRU in Q
+            prev = qPrev[slot]
+            next = qNext[slot]
+            qNext[prev] = next
+            qPrev[next] = prev
+            mru = qPrev[SENTINEL]
+            qNext[mru] = slot
+            qPrev[slot] = mru
+            qNext[slot] = SENTINEL
+            qPrev[SENTINEL] = slot
+        # always add the entry to the MRU of S
+        mru = sPrev[SENTINEL]
+        sNext[mru] = slot
+        sPrev[slot] = mru
+        sNext[slot] = SENTINEL
+        sPrev[SENTINEL] = slot
+        inS[slot] = True
+        alg.sLength += 1
+        if flag[slot] == HIR:
+            mru = hPrev[SENTINEL]
+            hNext[mru] = slot
+            hPrev[slot] = mru
+            hNext[slot] = SENTINEL
+            hPrev[SENTINEL] = slot
+        else:
+            alg.lirs += 1
+
+        # S grows by at most one block per reference, once it is over its
+        # limit shrink() takes it back to a length already recorded
+        if alg.sLength > maxSlength:
+            alg.shrink()
+        elif alg.sLength > alg.recordLirs:
+            alg.recordLirs = alg.sLength
+
+        if __debug__ and not alg.refs % checkInterval:
+            alg.checkInvariants()
+
+        if not hit:
+            alg.misses += 1
+        return hit
+
+    return processReference
+
+# yields the block numbers of the whole records in buf, the generator holds an
+# export of buf until it is exhausted or closed
+def parseRecords(buf):
+    return (block for (block,) in struct.iter_unpack(RECORD_FORMAT, buf))
+
+# yields the block numbers of an ascii trace, '*' lines are separators.
+# Parses a chunk of whole lines at a time.
+def parseAscii(f):
+    def chunks():
+        while True:
+            data = f.read(ASCII_CHUNK_SIZE)
+            if not data:
+                return
+            yield data + f.readline()
+    return chain.from_iterable(map(int, filter(b"*".__ne__, data.split())) for data in chunks())
+
+# replays blocks through alg, the first warmup references only fill the cache
+# and are not counted in the statistics
+def replay(alg, blocks, warmup):
+    blocks = iter(blocks)
+    if warmup:
+        alg.processTrace(islice(blocks, warmup))
+        alg.resetStatistics()
+    alg.processTrace(blocks)
+
+# replays the records in bytes [start, end) of a parda trace through a fresh LIRS,
+# the records in [warmupStart, start) only warm up the cache
+def simulateChunk(traceFileName, start, end, warmupStart, cacheSize, sizeLimitFactor, hirPercent):
+    alg = LIRS(cacheSize, sizeLimitFactor, hirPercent)
+    with open(traceFileName, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            with view[warmupStart:start] as warmup:
+                blocks = parseRecords(warmup)
+                try:
+                    alg.processTrace(blocks)
+                finally:
+                    blocks.close()
+            alg.resetStatistics()
+            with view[start:end] as chunk:
+                blocks = parseRecords(chunk)
+                try:
+                    alg.processTrace(blocks)
+                finally:
+                    blocks.close()
+    return alg.refs, alg.misses, alg.recordLirs, alg.pruneCount, alg.hirs
+
+# splits a parda trace into one chunk per worker and merges the statistics into alg.
+# As in a sequential replay the first warmup records are not measured. Every chunk
+# starts from a cold cache and is warmed up with the warmup records before it, so
+# the result approximates a sequential replay.
+def simulateParallel(alg, traceFileName, workers, warmup):
+    records = os.path.getsize(traceFileName) // RECORD_SIZE
+    if not records:
+        return
+    chunkRecords = -(-records // workers)
+    tasks = []
+    for first in range(0, records, chunkRecords):
+        start = max(first, warmup)
+        last = min(first + chunkRecords, records)
+        if start >= last:
+            # the whole chunk is in the global warmup
+            continue
+        tasks.append((traceFileName,
+                      start * RECORD_SIZE,
+                      last * RECORD_SIZE,
+                      max(0, start - warmup) * RECORD_SIZE,
+                      alg.c, alg.sizeLimitFactor, alg.hirPercent))
+    if not tasks:
+        return
+
+    with multiprocessing.Pool(workers) as pool:
+        results = pool.starmap(simulateChunk, tasks)
+
+    for refs, misses, recordLirs, pruneCount, hirs in results:
+        alg.refs += refs
+        alg.misses += misses
+        alg.recordLirs = max(alg.recordLirs, recordLirs)
+        alg.pruneCount += pruneCount
+        alg.hirs = hirs
 
 def Usage(appName):
-    print usageString % appName
-    exit()
+    print(usageString % appName)
+    sys.exit()
 
 def main():
     traceFileName = None
@@ -246,9 +588,11 @@ def main():
     sizeLimitFactor = DEFAULT_STACK_FACTOR
     asciiMode = False
     hirPercent = DEFAULT_HIR_PCT
+    workers = DEFAULT_WORKERS
+    warmup = DEFAULT_WARMUP
     options, remainder = getopt.getopt(sys.argv[1:],
-                                       'i:s:f:r:ah',
-                                       ['-i', '-s', '-f', '-a', '-r', '-h'])
+                                       'i:s:f:r:p:w:ah',
+                                       ['-i', '-s', '-f', '-a', '-r', '-p', '-w', '-h'])
 
     for opt, arg in options:
         if opt == "-i":
@@ -259,6 +603,10 @@ def main():
             sizeLimitFactor = float(arg)
         elif opt == "-r":
             hirPercent = int(arg)
+        elif opt == "-p":
+            workers = int(arg)
+        elif opt == "-w":
+            warmup = int(arg)
         elif opt == "-a":
             asciiMode = True
         elif opt == "-h":
@@ -266,46 +614,54 @@ def main():
             return
 
     if traceFileName == None:
-        print "Please provide a trace file"
+        print("Please provide a trace file")
         Usage(appName)
 
     if sizeLimitFactor < MIN_STACK_FACTOR:
-        print "Please provide a stack factor > %f" % MIN_STACK_FACTOR
+        print("Please provide a stack factor > %f" % MIN_STACK_FACTOR)
         Usage(appName)
 
     if cacheSize < MIN_CACHE_SIZE:
-        print "Please provide a cache size > %d" % MIN_CACHE_SIZE
+        print("Please provide a cache size > %d" % MIN_CACHE_SIZE)
         Usage(appName)
 
     if hirPercent < MIN_HIR_PCT or hirPercent > MAX_HIR_PCT:
-        print "Please provide a HIR percent value in [%d,%d]" % (MIN_HIR_PCT, MAX_HIR_PCT)
+        print("Please provide a HIR percent value in [%d,%d]" % (MIN_HIR_PCT, MAX_HIR_PCT))
+        Usage(appName)
+
+    if workers < 1:
+        print("Please provide a number of workers >= 1")
+        Usage(appName)
+
+    if warmup < 0:
+        print("Please provide a number of warmup references >= 0")
+        Usage(appName)
+
+    if workers > 1 and asciiMode:
+        print("Parallel replay needs a parda trace")
         Usage(appName)
 
     alg = LIRS(cacheSize, sizeLimitFactor, hirPercent)
 
-    if asciiMode:
-        with open(traceFileName, "r") as f:
-            last = None
-            for line in f.xreadlines():
-                line = line.strip()
-                if line == "*":
-                    continue
-
-                block = int(line)
-                alg.processReference(block)
-                last = line
+    if workers > 1:
+        simulateParallel(alg, traceFileName, workers, warmup)
+    elif asciiMode:
+        with open(traceFileName, "rb") as f:
+            replay(alg, parseAscii(f), warmup)
     else:
         with open(traceFileName, "rb") as f:
-            lastBlock = None
-            while True:
-                data = f.read(8)
-                if not data:
-                    # end of file
-                    break
-
-                block = struct.unpack('Q', data)
-                alg.processReference(block)
-                lastBlock = block
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                # a truncated last record is ignored, as in the parallel replay
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                    with view[:size - size % RECORD_SIZE] as records:
+                        blocks = parseRecords(records)
+                        try:
+                            replay(alg, blocks, warmup)
+                        finally:
+                            # a traceback keeps the generator alive, release its
+                            # export of records before the views are released
+                            blocks.close()
 
     alg.print_statistics()
 